@@ -5,14 +5,14 @@ Uses Google Drive with user OAuth for storage (no service account quota issues)
 """
 
 import base64
+import hashlib
 import io
 import logging
 import sys
 from datetime import datetime
 from pathlib import Path
 
-import numpy as np
-import pandas as pd
+import openpyxl
 import streamlit as st
 import streamlit.components.v1 as components
 from PIL import Image
@@ -37,9 +37,10 @@ logging.basicConfig(
 )
 
 logger = logging.getLogger(__name__)
-logger.info("="*80)
-logger.info("Fieldmap Application Starting")
-logger.info("="*80)
+
+# Streamlit re-executes this script on every rerun, so per-rerun messages
+# are logged at DEBUG level with lazy %-formatting
+logger.debug("Fieldmap script run starting")
 
 
 
@@ -152,21 +153,110 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 
+# Header row of the Excel export, in column order
+EXPORT_COLUMNS = ('Session', 'Photo ID', 'Timestamp', 'Comment', 'Has Annotations')
+
+
+@st.cache_resource(show_spinner=False)
+def load_asset_image(filename):
+    """
+    Load an image from the assets folder, decoded once per process.
+    
+    Args:
+        filename: Name of the file in the assets folder
+    
+    Returns:
+        PIL Image object, or None if the file does not exist
+    """
+    asset_path = Path(__file__).parent / "assets" / filename
+    if not asset_path.exists():
+        return None
+    with Image.open(asset_path) as asset:
+        asset.load()
+        return asset.copy()
+
+
+def make_thumbnail(image):
+    """
+    Create a gallery thumbnail for a photo.
+    
+    Args:
+        image: PIL Image object of the photo
+    
+    Returns:
+        PIL Image object fitting in 100x100
+    """
+    # Resize straight to the target size like Image.thumbnail does, but
+    # without first copying the full-resolution photo
+    scale = min(100 / image.width, 100 / image.height)
+    if scale >= 1:
+        return image.copy()
+    size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+    return image.resize(size, Image.Resampling.LANCZOS, reducing_gap=2.0)
+
+
+def make_upload_thumbnail(image_bytes):
+    """
+    Create a gallery thumbnail directly from uploaded image bytes.
+    
+    For JPEGs, Image.draft lets the decoder downscale while decoding, so the
+    thumbnail is made without decoding the full-resolution frame.
+    
+    Args:
+        image_bytes: Encoded image file contents
+    
+    Returns:
+        PIL Image object fitting in 100x100
+    """
+    with Image.open(io.BytesIO(image_bytes)) as source:
+        if source.format == 'JPEG':
+            source.draft('RGB', (200, 200))
+        return make_thumbnail(source)
+
+
+def thumbnail_to_data_url(thumbnail):
+    """
+    Encode a thumbnail as a data URL for gallery tiles.
+    
+    Args:
+        thumbnail: PIL Image object from make_thumbnail
+    
+    Returns:
+        str: "data:image/jpeg;base64,..." URL
+    """
+    # JPEG keeps the data URL several times smaller than PNG for photos;
+    # it has no alpha channel, so flatten anything that isn't RGB/L first
+    if thumbnail.mode not in ('RGB', 'L'):
+        thumbnail = thumbnail.convert('RGB')
+    with io.BytesIO() as thumb_buffer:
+        thumbnail.save(thumb_buffer, format='JPEG', quality=80, optimize=True)
+        thumb_base64 = base64.b64encode(thumb_buffer.getvalue()).decode()
+    return f"data:image/jpeg;base64,{thumb_base64}"
+
+
 class SessionStore:
     """Manages session state and CRUD operations for sessions and photos"""
     
-    def __init__(self, storage_backend=None):
+    def __init__(self, storage_backend=None, user_email=None):
         """
         Initialize SessionStore with optional storage backend.
         
         Args:
             storage_backend: Optional PhotoStorage instance for persistent storage
+            user_email: Email of the signed-in user the storage belongs to
         """
         self.storage = storage_backend
+        # Identifies whose index is in session state; without a user, the
+        # storage backend itself
+        self.index_owner = user_email if user_email is not None else storage_backend
         self._initialize_state()
         
-        # Load from Drive index if storage available
-        if self.storage and hasattr(self.storage, 'load_index'):
+        # Load from Drive index if storage available. Streamlit rebuilds the
+        # store on every rerun, so only do this once per sign-in (logout clears
+        # the marker); reloading would replace the photos and drop their
+        # decoded images.
+        if (self.storage and hasattr(self.storage, 'load_index')
+                and st.session_state.get('drive_index_user') != self.index_owner):
             try:
                 self._load_from_drive_index()
             except Exception as e:
@@ -176,6 +266,9 @@ class SessionStore:
         """Load sessions and photos from Drive index.json"""
         try:
             index_data = self.storage.load_index()
+            # Any successful load counts, including an empty index; reloading
+            # later would replace photos added since with on-demand stubs
+            st.session_state.drive_index_user = self.index_owner
             
             if index_data.get('sessions'):
                 st.session_state.sessions = {}
@@ -204,7 +297,7 @@ class SessionStore:
                 if 'photo_counter' in index_data:
                     st.session_state.photo_counter = index_data['photo_counter']
                 
-                logger.info(f"Loaded {len(st.session_state.sessions)} sessions from Drive index")
+                logger.debug("Loaded %d sessions from Drive index", len(st.session_state.sessions))
         except Exception as e:
             logger.error(f"Error loading from Drive index: {e}")
     
@@ -237,8 +330,13 @@ class SessionStore:
                     }
                     index_data['sessions'][session_name].append(photo_meta)
             
-            self.storage.save_index(index_data)
-            logger.info("Saved index to Drive")
+            # Upload in the background so the rerun isn't blocked on Drive
+            if hasattr(self.storage, 'save_index_async'):
+                self.storage.save_index_async(index_data)
+                logger.debug("Queued index save to Drive")
+            else:
+                self.storage.save_index(index_data)
+                logger.info("Saved index to Drive")
         except Exception as e:
             logger.error(f"Error saving to Drive index: {e}")
     
@@ -258,6 +356,8 @@ class SessionStore:
             st.session_state.camera_photo_hash = None
         if 'camera_key' not in st.session_state:
             st.session_state.camera_key = 0
+        if 'photo_index' not in st.session_state:
+            st.session_state.photo_index = {}
     
     @property
     def sessions(self):
@@ -287,23 +387,18 @@ class SessionStore:
             return True
         return False
     
-    def add_photo(self, image, session_name, comment=""):
-        """Add a photo with metadata to a session"""
-        st.session_state.photo_counter += 1
-        photo_id = st.session_state.photo_counter
-        
-        # Create thumbnail for efficient gallery display
-        thumbnail = image.copy()
-        thumbnail.thumbnail((100, 100), Image.Resampling.LANCZOS)
+    def _save_image_to_storage(self, session_name, photo_id, image):
+        """
+        Save a photo's image to the storage backend, if there is one.
         
-        # Convert thumbnail to base64 data URL for gallery tiles
-        thumb_buffer = io.BytesIO()
-        thumbnail.save(thumb_buffer, format='PNG')
-        thumb_buffer.seek(0)
-        thumb_base64 = base64.b64encode(thumb_buffer.getvalue()).decode()
-        thumb_data_url = f"data:image/png;base64,{thumb_base64}"
+        Args:
+            session_name: Name of the session
+            photo_id: Unique photo ID
+            image: PIL Image object to save
         
-        # Save to storage backend (Google Drive with service account)
+        Returns:
+            tuple: (storage_uri, file_id), with None for anything unavailable
+        """
         storage_uri = None
         file_id = None
         if self.storage:
@@ -313,11 +408,31 @@ class SessionStore:
                     file_id = storage_uri.replace('gdrive://', '')
             except Exception as e:
                 logger.warning(f"Failed to save to storage: {e}")
+        return storage_uri, file_id
+    
+    def add_photo(self, image, session_name, comment="", thumbnail=None):
+        """
+        Add a photo with metadata to a session.
+        
+        The image is stored as-is rather than copied, so callers must not
+        modify it afterwards. A thumbnail can be passed in when the caller
+        can make one more cheaply, e.g. with make_upload_thumbnail.
+        """
+        st.session_state.photo_counter += 1
+        photo_id = st.session_state.photo_counter
+        
+        # Create thumbnail and its data URL once for efficient gallery display
+        if thumbnail is None:
+            thumbnail = make_thumbnail(image)
+        thumb_data_url = thumbnail_to_data_url(thumbnail)
+        
+        # Save to storage backend (Google Drive with user OAuth)
+        storage_uri, file_id = self._save_image_to_storage(session_name, photo_id, image)
         
         photo_data = {
             'id': photo_id,
-            'original_image': image.copy(),
-            'current_image': image.copy(),
+            'original_image': image,
+            'current_image': image,
             'thumbnail': thumbnail,
             'thumb_data_url': thumb_data_url,
             'comment': comment,
@@ -330,13 +445,19 @@ class SessionStore:
             '_loaded': True
         }
         st.session_state.sessions[session_name].append(photo_data)
+        self._forget_photo_index(session_name)
         
         self._save_to_drive_index()
         
         return photo_data['id']
     
     def add_derived_photo(self, base_photo_id, session_name, image, comment=None):
-        """Create a new photo derived from an existing photo (e.g., annotated version)"""
+        """
+        Create a new photo derived from an existing photo (e.g., annotated version).
+        
+        The image is stored as-is rather than copied, so callers must not
+        modify it afterwards.
+        """
         base_photo = self.get_photo(base_photo_id, session_name)
         if not base_photo:
             raise ValueError(f"Base photo {base_photo_id} not found in session {session_name}")
@@ -344,32 +465,18 @@ class SessionStore:
         st.session_state.photo_counter += 1
         photo_id = st.session_state.photo_counter
         
-        thumbnail = image.copy()
-        thumbnail.thumbnail((100, 100), Image.Resampling.LANCZOS)
-        
-        thumb_buffer = io.BytesIO()
-        thumbnail.save(thumb_buffer, format='PNG')
-        thumb_buffer.seek(0)
-        thumb_base64 = base64.b64encode(thumb_buffer.getvalue()).decode()
-        thumb_data_url = f"data:image/png;base64,{thumb_base64}"
+        thumbnail = make_thumbnail(image)
+        thumb_data_url = thumbnail_to_data_url(thumbnail)
         
         if comment is None:
             comment = base_photo['comment']
         
-        storage_uri = None
-        file_id = None
-        if self.storage:
-            try:
-                storage_uri = self.storage.save_image(session_name, photo_id, image)
-                if storage_uri and storage_uri.startswith('gdrive://'):
-                    file_id = storage_uri.replace('gdrive://', '')
-            except Exception as e:
-                logger.warning(f"Failed to save to storage: {e}")
+        storage_uri, file_id = self._save_image_to_storage(session_name, photo_id, image)
         
         photo_data = {
             'id': photo_id,
-            'original_image': image.copy(),
-            'current_image': image.copy(),
+            'original_image': image,
+            'current_image': image,
             'thumbnail': thumbnail,
             'thumb_data_url': thumb_data_url,
             'comment': comment,
@@ -382,6 +489,7 @@ class SessionStore:
             '_loaded': True
         }
         st.session_state.sessions[session_name].append(photo_data)
+        self._forget_photo_index(session_name)
         
         self._save_to_drive_index()
         
@@ -395,6 +503,8 @@ class SessionStore:
                 if photo['id'] == photo_id:
                     moved_photo = photos.pop(i)
                     st.session_state.sessions[to_session].append(moved_photo)
+                    self._forget_photo_index(from_session)
+                    self._forget_photo_index(to_session)
                     self._save_to_drive_index()
                     return True
         return False
@@ -406,29 +516,63 @@ class SessionStore:
             for i, photo in enumerate(photos):
                 if photo['id'] == photo_id:
                     photos.pop(i)
+                    self._forget_photo_index(session_name)
+                    self._close_photo_images(photo)
                     self._save_to_drive_index()
                     return True
         return False
     
+    def _close_photo_images(self, photo):
+        """Release the decoded images held by a photo that is being dropped"""
+        for key in ('original_image', 'current_image', 'thumbnail'):
+            image = photo.get(key)
+            if image is not None:
+                image.close()
+                photo[key] = None
+    
     def update_photo_comment(self, photo_id, session_name, new_comment):
         """Update the comment for a photo"""
-        if session_name in st.session_state.sessions:
-            for photo in st.session_state.sessions[session_name]:
-                if photo['id'] == photo_id:
-                    photo['comment'] = new_comment
-                    self._save_to_drive_index()
-                    return True
+        photo = self._get_photo_index(session_name).get(photo_id)
+        if photo is not None:
+            photo['comment'] = new_comment
+            self._save_to_drive_index()
+            return True
         return False
     
     def get_photo(self, photo_id, session_name):
         """Get a photo by ID from a session"""
-        if session_name in st.session_state.sessions:
-            for photo in st.session_state.sessions[session_name]:
-                if photo['id'] == photo_id:
-                    if not photo.get('_loaded', True) and photo.get('storage_uri'):
-                        self._load_photo_image(photo)
-                    return photo
-        return None
+        photo = self._get_photo_index(session_name).get(photo_id)
+        if photo is not None and not photo.get('_loaded', True) and photo.get('storage_uri'):
+            self._load_photo_image(photo)
+        return photo
+    
+    def _get_photo_index(self, session_name):
+        """
+        Get the photo ID -> photo lookup for a session.
+        
+        The lookup is kept in session state and rebuilt whenever the
+        session's photo list is replaced or changes length, e.g. by the
+        gallery's drag-and-drop reordering.
+        
+        Args:
+            session_name: Name of the session
+        
+        Returns:
+            dict: Photo dicts keyed by photo ID (empty for unknown sessions)
+        """
+        photos = st.session_state.sessions.get(session_name)
+        if photos is None:
+            return {}
+        
+        entry = st.session_state.photo_index.get(session_name)
+        if entry is None or entry[0] is not photos or entry[1] != len(photos):
+            entry = (photos, len(photos), {photo['id']: photo for photo in photos})
+            st.session_state.photo_index[session_name] = entry
+        return entry[2]
+    
+    def _forget_photo_index(self, session_name):
+        """Drop the cached photo lookup for a session after changing it"""
+        st.session_state.photo_index.pop(session_name, None)
     
     def _load_photo_image(self, photo):
         """Load image data from Drive for a photo"""
@@ -438,48 +582,72 @@ class SessionStore:
         try:
             image = self.storage.load_image(photo['storage_uri'])
             
-            photo['original_image'] = image.copy()
-            photo['current_image'] = image.copy()
-            
-            if not photo.get('thumbnail'):
-                thumbnail = image.copy()
-                thumbnail.thumbnail((100, 100), Image.Resampling.LANCZOS)
-                photo['thumbnail'] = thumbnail
+            photo['original_image'] = image
+            photo['current_image'] = image
             
-            if not photo.get('thumb_data_url'):
-                thumb = photo.get('thumbnail')
-                if thumb:
-                    thumb_buffer = io.BytesIO()
-                    thumb.save(thumb_buffer, format='PNG')
-                    thumb_buffer.seek(0)
-                    thumb_base64 = base64.b64encode(thumb_buffer.getvalue()).decode()
-                    photo['thumb_data_url'] = f"data:image/png;base64,{thumb_base64}"
+            if photo.get('thumbnail') is None:
+                photo['thumbnail'] = make_thumbnail(image)
             
             photo['_loaded'] = True
-            logger.info(f"Loaded image for photo {photo['id']} from Drive")
+            logger.debug("Loaded image for photo %s from Drive", photo['id'])
         except Exception as e:
             logger.error(f"Failed to load image for photo {photo['id']}: {e}")
     
+    def get_thumb_data_url(self, photo):
+        """
+        Get a photo's gallery thumbnail as a data URL.
+        
+        The URL is cached on the photo, so each thumbnail is encoded at most
+        once rather than on every gallery render.
+        
+        Args:
+            photo: Photo dict from a session
+        
+        Returns:
+            str: Thumbnail data URL, or '' if the image is unavailable
+        """
+        thumb_url = photo.get('thumb_data_url') or ''
+        if thumb_url.startswith('data:image/'):
+            return thumb_url
+        
+        if photo.get('thumbnail') is None:
+            if photo.get('current_image') is None:
+                self._load_photo_image(photo)
+            if photo.get('current_image') is None:
+                return ''
+            photo['thumbnail'] = make_thumbnail(photo['current_image'])
+        
+        photo['thumb_data_url'] = thumbnail_to_data_url(photo['thumbnail'])
+        return photo['thumb_data_url']
+    
     def export_to_excel(self):
         """Export all photos and comments to Excel"""
-        data = []
-        for session_name, photos in st.session_state.sessions.items():
-            for photo in photos:
-                data.append({
-                    'Session': session_name,
-                    'Photo ID': photo['id'],
-                    'Timestamp': photo['timestamp'],
-                    'Comment': photo['comment'],
-                    'Has Annotations': 'Yes' if photo['has_annotations'] else 'No'
-                })
-        
-        if data:
-            df = pd.DataFrame(data)
-            output = io.BytesIO()
-            with pd.ExcelWriter(output, engine='openpyxl') as writer:
-                df.to_excel(writer, index=False, sheet_name='Photo Annotations')
+        sessions = st.session_state.sessions
+        if not any(sessions.values()):
+            return None
+        
+        # Values-only sheet, so a write-only workbook streams rows without
+        # building a DataFrame or keeping cell objects in memory
+        workbook = openpyxl.Workbook(write_only=True)
+        sheet = workbook.create_sheet('Photo Annotations')
+        rows = (
+            (
+                session_name,
+                photo['id'],
+                photo['timestamp'],
+                photo['comment'],
+                'Yes' if photo['has_annotations'] else 'No'
+            )
+            for session_name, photos in sessions.items()
+            for photo in photos
+        )
+        sheet.append(EXPORT_COLUMNS)
+        for row in rows:
+            sheet.append(row)
+        
+        with io.BytesIO() as output:
+            workbook.save(output)
             return output.getvalue()
-        return None
 
 
 class BasePage:
@@ -497,14 +665,11 @@ class FieldmapPage(BasePage):
     """Main fieldmap page with camera and annotation"""
     
     def render(self):
-        import hashlib
-        
         # Header with logo
         st.markdown('<div class="header-logo">', unsafe_allow_html=True)
         try:
-            logo_path = Path(__file__).parent / "assets" / "logo.png"
-            if logo_path.exists():
-                logo_image = Image.open(logo_path)
+            logo_image = load_asset_image("logo.png")
+            if logo_image is not None:
                 st.image(logo_image, width=180)
             else:
                 st.markdown('<div class="logo-fallback">Fieldmap</div>', unsafe_allow_html=True)
@@ -566,7 +731,12 @@ class FieldmapPage(BasePage):
             current_photo_hash = hashlib.md5(image_bytes).hexdigest()
             
             if current_photo_hash != st.session_state.camera_photo_hash:
-                photo_id = self.session_store.add_photo(image, self.session_store.current_session, "")
+                photo_id = self.session_store.add_photo(
+                    image,
+                    self.session_store.current_session,
+                    "",
+                    thumbnail=make_upload_thumbnail(image_bytes)
+                )
                 st.session_state.last_saved_photo_id = photo_id
                 st.session_state.camera_photo_hash = current_photo_hash
                 st.session_state.camera_key += 1
@@ -650,6 +820,38 @@ class GalleryPage(BasePage):
         
         self._render_draggable_view()
     
+    def _get_tile_html(self, photo, session_name):
+        """
+        Get the gallery tile HTML for a photo.
+        
+        The HTML is cached on the photo and only rebuilt when the photo's
+        session, variant or thumbnail changes, so reruns reuse the same
+        strings instead of reformatting every tile.
+        
+        Args:
+            photo: Photo dict from a session
+            session_name: Name of the session the tile is shown in
+        
+        Returns:
+            str: Tile HTML for the sortable gallery
+        """
+        thumb_url = self.session_store.get_thumb_data_url(photo)
+        variant = photo.get('variant')
+        tile_key = (session_name, variant, thumb_url)
+        
+        cached = photo.get('_tile_html')
+        if cached is not None and cached[0] == tile_key:
+            return cached[1]
+        
+        variant_badge = "📝 " if variant == 'annotated' else ""
+        # Add a data attribute to store photo info for click handling
+        item_html = f'''<div style="text-align:center;" data-photo-id="{photo['id']}" data-session="{session_name}">
+                    <img src="{thumb_url}" style="width:84px;height:84px;object-fit:cover;border-radius:4px;cursor:pointer;" />
+                    <div style="font-size:10px;margin-top:2px;">{variant_badge}#{int(photo['id'])}</div>
+                </div>'''
+        photo['_tile_html'] = (tile_key, item_html)
+        return item_html
+    
     def _render_draggable_view(self):
         """Render draggable view with photo thumbnails as tiles"""
         st.info("📱 Drag photos between sessions to organize them. Click a tile to view details.")
@@ -662,36 +864,7 @@ class GalleryPage(BasePage):
             photos = self.session_store.sessions[session_name]
             items = []
             for photo in photos:
-                if 'thumb_data_url' not in photo or not photo['thumb_data_url']:
-                    thumb = photo.get('thumbnail')
-                    if not thumb:
-                        thumb = photo['current_image'].copy()
-                        thumb.thumbnail((100, 100), Image.Resampling.LANCZOS)
-                        photo['thumbnail'] = thumb
-                    
-                    thumb_buffer = io.BytesIO()
-                    thumb.save(thumb_buffer, format='PNG')
-                    thumb_buffer.seek(0)
-                    thumb_base64 = base64.b64encode(thumb_buffer.getvalue()).decode()
-                    photo['thumb_data_url'] = f"data:image/png;base64,{thumb_base64}"
-                
-                thumb_url = photo['thumb_data_url']
-                if not thumb_url.startswith('data:image/'):
-                    thumb = photo.get('thumbnail', photo['current_image'].copy())
-                    thumb.thumbnail((100, 100), Image.Resampling.LANCZOS)
-                    thumb_buffer = io.BytesIO()
-                    thumb.save(thumb_buffer, format='PNG')
-                    thumb_buffer.seek(0)
-                    thumb_base64 = base64.b64encode(thumb_buffer.getvalue()).decode()
-                    thumb_url = f"data:image/png;base64,{thumb_base64}"
-                    photo['thumb_data_url'] = thumb_url
-                
-                variant_badge = "📝 " if photo.get('variant') == 'annotated' else ""
-                # Add a data attribute to store photo info for click handling
-                item_html = f'''<div style="text-align:center;" data-photo-id="{photo['id']}" data-session="{session_name}">
-                    <img src="{thumb_url}" style="width:84px;height:84px;object-fit:cover;border-radius:4px;cursor:pointer;" />
-                    <div style="font-size:10px;margin-top:2px;">{variant_badge}#{int(photo['id'])}</div>
-                </div>'''
+                item_html = self._get_tile_html(photo, session_name)
                 
                 item_id = f"photo_{photo['id']}"
                 items.append(item_html)
@@ -804,7 +977,7 @@ class GalleryPage(BasePage):
                             move_op['to_session']
                         )
                         if success:
-                            logger.info(f"Moved photo in Drive: {move_op['file_id']} from {move_op['from_session']} to {move_op['to_session']}")
+                            logger.debug("Moved photo in Drive: %s from %s to %s", move_op['file_id'], move_op['from_session'], move_op['to_session'])
                     except Exception as e:
                         logger.error(f"Failed to move photo in Drive: {e}")
                         st.error(f"⚠️ Failed to update Drive folder for some photos. Changes saved locally.")
@@ -919,7 +1092,7 @@ class GalleryPage(BasePage):
         with col_reset:
             if photo['has_annotations'] and not photo.get('source_photo_id'):
                 if st.button("Reset Annotations", key=f"reset_{photo['id']}", type="secondary"):
-                    photo['current_image'] = photo['original_image'].copy()
+                    photo['current_image'] = photo['original_image']
                     photo['has_annotations'] = False
                     st.success("Annotations cleared!")
                     st.rerun()
@@ -993,6 +1166,11 @@ class GalleryPage(BasePage):
 class AboutPage(BasePage):
     """About page with app information and authentication"""
     
+    def __init__(self, session_store, user_authenticated: bool = False):
+        super().__init__(session_store)
+        # Sign-in status as already checked by the app for this rerun
+        self.user_authenticated = user_authenticated
+    
     def render(self):
         # No header on About page per requirements
         
@@ -1050,18 +1228,15 @@ class AboutPage(BasePage):
         </style>
         """, unsafe_allow_html=True)
         
-        # Check authentication status
-        user_authenticated = is_authenticated()
-        user_email = get_user_email()
+        user_authenticated = self.user_authenticated
         
         col_left, col_right = st.columns([1.2, 1])
         
         with col_left:
             # Logo
             try:
-                logo_path = Path(__file__).parent / "assets" / "logo.png"
-                if logo_path.exists():
-                    logo_image = Image.open(logo_path)
+                logo_image = load_asset_image("logo.png")
+                if logo_image is not None:
                     st.image(logo_image, width=250)
             except Exception:
                 pass
@@ -1093,10 +1268,15 @@ class AboutPage(BasePage):
             
             if user_authenticated:
                 # User is signed in
-                st.success(f"✅ Signed in as **{user_email}**")
+                st.success(f"✅ Signed in as **{get_user_email()}**")
                 st.info("📱 Use the sidebar to access Fieldmap and Gallery")
                 
                 if st.button("Sign Out", key="signout_btn", type="secondary", use_container_width=True):
+                    # Finish pending index uploads while the credentials are
+                    # still valid
+                    storage_backend = st.session_state.get('drive_storage')
+                    if storage_backend is not None:
+                        storage_backend.flush_index_writes()
                     logout()
                     st.rerun()
             else:
@@ -1107,10 +1287,8 @@ class AboutPage(BasePage):
                 if st.button("🔐 Sign in with Google", key="signin_btn", type="primary", use_container_width=True):
                     # Generate authorization URL and redirect
                     try:
-                        auth_url, state = get_authorization_url()
-                        
-                        # Store state in session for CSRF protection
-                        st.session_state["oauth_state"] = state
+                        # The state token is signed, so nothing needs storing
+                        auth_url, _ = get_authorization_url()
                         
                         # Redirect to Google OAuth
                         st.markdown(f'<meta http-equiv="refresh" content="0;url={auth_url}" />', unsafe_allow_html=True)
@@ -1125,9 +1303,8 @@ class AboutPage(BasePage):
         with col_right:
             # Hero image
             try:
-                hero_path = Path(__file__).parent / "assets" / "biomedical.jpg"
-                if hero_path.exists():
-                    hero_image = Image.open(hero_path)
+                hero_image = load_asset_image("biomedical.jpg")
+                if hero_image is not None:
                     st.markdown('<div class="hero-image">', unsafe_allow_html=True)
                     st.image(hero_image, use_column_width=True)
                     st.markdown('</div>', unsafe_allow_html=True)
@@ -1139,52 +1316,84 @@ class App:
     """Main application class that orchestrates the UI and routing"""
     
     def __init__(self):
-        logger.info("Initializing Fieldmap application")
+        logger.debug("Initializing Fieldmap application")
         
         # Initialize storage backend with user OAuth credentials
         storage_backend = None
         
-        if is_authenticated():
+        # Checked once per rerun and shared by run() and render_sidebar()
+        self.user_authenticated = is_authenticated()
+        
+        if self.user_authenticated:
             user_credentials = get_user_credentials()
             
             if user_credentials:
-                try:
-                    logger.info("Attempting to initialize Google Drive storage with user OAuth...")
-                    storage_backend = GoogleDriveStorage(user_credentials)
-                    logger.info("✓ Google Drive storage (user OAuth) initialized successfully")
-                    
-                    # Test connection
-                    try:
-                        storage_backend.test_connection()
-                        logger.info("✓ Successfully connected to Google Drive API")
-                    except Exception as e:
-                        logger.error(f"✗ Failed to connect to Google Drive API: {e}", exc_info=True)
-                        logger.warning("⚠️ Drive storage may be unavailable")
-                        storage_backend = None
-                except Exception as e:
-                    logger.error(f"✗ Failed to initialize Google Drive storage: {e}", exc_info=True)
-                    storage_backend = None
+                storage_backend = self._get_drive_storage(user_credentials)
             else:
                 logger.warning("⚠️ User credentials not available")
         else:
-            logger.info("User not authenticated - Drive storage will be initialized after sign-in")
+            signed_out_storage = st.session_state.pop('drive_storage', None)
+            if signed_out_storage is not None:
+                signed_out_storage.flush_index_writes()
+            logger.debug("User not authenticated - Drive storage will be initialized after sign-in")
         
-        self.session_store = SessionStore(storage_backend=storage_backend)
+        self.session_store = SessionStore(storage_backend=storage_backend, user_email=get_user_email())
         self.pages = {
             'Fieldmap': FieldmapPage(self.session_store),
             'Gallery': GalleryPage(self.session_store),
-            'About': AboutPage(self.session_store)
+            'About': AboutPage(self.session_store, self.user_authenticated)
         }
-        logger.info("✓ Application initialization complete")
+        logger.debug("✓ Application initialization complete")
+    
+    def _get_drive_storage(self, user_credentials):
+        """
+        Get the Google Drive storage backend for the signed-in user.
+        
+        The backend keeps its Drive service, folder IDs and index cache, so it is
+        stored in session state and reused across reruns until the credentials
+        change (e.g. a new sign-in).
+        
+        Args:
+            user_credentials: Google OAuth credentials object from oauth_utils
+        
+        Returns:
+            GoogleDriveStorage instance, or None if Drive is unavailable
+        """
+        storage_backend = st.session_state.get('drive_storage')
+        if storage_backend is not None:
+            if storage_backend.credentials is user_credentials:
+                return storage_backend
+            # Let the old backend's queued index uploads land before the new
+            # one loads the index from Drive
+            storage_backend.flush_index_writes()
+        
+        try:
+            logger.info("Attempting to initialize Google Drive storage with user OAuth...")
+            storage_backend = GoogleDriveStorage(user_credentials)
+            logger.info("✓ Google Drive storage (user OAuth) initialized successfully")
+            
+            # Test connection
+            try:
+                storage_backend.test_connection()
+                logger.info("✓ Successfully connected to Google Drive API")
+            except Exception as e:
+                logger.error(f"✗ Failed to connect to Google Drive API: {e}", exc_info=True)
+                logger.warning("⚠️ Drive storage may be unavailable")
+                return None
+        except Exception as e:
+            logger.error(f"✗ Failed to initialize Google Drive storage: {e}", exc_info=True)
+            return None
+        
+        st.session_state['drive_storage'] = storage_backend
+        return storage_backend
     
     def render_sidebar(self):
         """Render sidebar with logo and navigation"""
         with st.sidebar:
             st.markdown('<div class="sidebar-logo">', unsafe_allow_html=True)
             try:
-                logo_path = Path(__file__).parent / "assets" / "logo.png"
-                if logo_path.exists():
-                    logo_image = Image.open(logo_path)
+                logo_image = load_asset_image("logo.png")
+                if logo_image is not None:
                     st.image(logo_image, use_column_width=True)
                 else:
                     st.markdown('<div class="logo-fallback">Fieldmap</div>', unsafe_allow_html=True)
@@ -1195,12 +1404,9 @@ class App:
             st.markdown('<div class="sidebar-title">Fieldmap</div>', unsafe_allow_html=True)
             st.markdown('<div class="sidebar-subtitle">Documentation support for the cadaver lab.</div>', unsafe_allow_html=True)
             
-            # Check if user is authenticated
-            user_is_authenticated = is_authenticated()
-            
             st.markdown('<div class="sidebar-section-label">Sections</div>', unsafe_allow_html=True)
             
-            if not user_is_authenticated:
+            if not self.user_authenticated:
                 st.info("Please sign in on the About page to access Fieldmap and Gallery.")
                 current_index = 0
                 selected_page = st.radio(
@@ -1224,11 +1430,8 @@ class App:
     
     def run(self):
         """Main application entry point"""
-        # Check authentication status
-        user_is_authenticated = is_authenticated()
-        
         # Implement navigation gating: force About page if not authenticated
-        if not user_is_authenticated:
+        if not self.user_authenticated:
             if self.session_store.current_page != 'About':
                 self.session_store.current_page = 'About'
         
@@ -4,19 +4,138 @@ Handles OAuth flow, token management, and encrypted cookie storage.
 """
 
 import streamlit as st
+import base64
+import functools
+import hashlib
+import hmac
 import json
 import secrets
+import threading
+import time
 from typing import Optional, Dict, Any
-from datetime import datetime, timedelta
 import logging
+from datetime import datetime, timezone
+
+try:
+    import requests
+    from requests.adapters import HTTPAdapter
+    from google.oauth2.credentials import Credentials
+    from google.auth import jwt
+    from google.auth.transport.requests import Request
+except ImportError:
+    # Google auth libraries are only needed once a user signs in
+    requests = None
+    HTTPAdapter = None
+    Credentials = None
+    jwt = None
+    Request = None
 
 logger = logging.getLogger(__name__)
 
+# OAuth scopes requested from Google (immutable, built once per process)
+OAUTH_SCOPES = (
+    "https://www.googleapis.com/auth/drive.file",  # Create and manage files
+    "https://www.googleapis.com/auth/userinfo.email",  # User email
+    "openid",  # OpenID Connect
+)
+
+# Session state key holding the signed-in user's auth state as one plain dict:
+# {"tokens": token info, "email": ..., "name": ..., "credentials": Credentials}
+_AUTH_SESSION_KEY = "_google_auth"
+
+# Session state keys cleared on logout: the auth state, the Drive storage
+# backend built from the user's credentials and the marker of which user the
+# app last loaded its Drive index for
+_LOGOUT_SESSION_KEYS = (_AUTH_SESSION_KEY, "drive_storage", "drive_index_user")
+
+# Tokens expiring within this many seconds are treated as stale; kept above
+# google-auth's own refresh threshold so the fast path never disagrees with it
+_EXPIRY_SKEW_SECONDS = 300
+
+# Google OpenID Connect userinfo endpoint
+_USERINFO_URL = "https://openidconnect.googleapis.com/v1/userinfo"
+
+# Timeout (connect, read) in seconds for direct calls to Google endpoints
+_HTTP_TIMEOUT = (5, 15)
+
+# Pooled HTTP session shared by token refreshes and userinfo lookups so they
+# reuse connections (google-auth's Request() otherwise opens a new
+# requests.Session each time)
+_http_session = None
+_http_session_guard = threading.Lock()
+
+# OAuth config loaded from secrets (None until a complete config is found)
+_oauth_config: Optional[Dict[str, str]] = None
+
+# Signed OAuth state tokens older than this are rejected by the callback
+_STATE_MAX_AGE_SECONDS = 600
+
+# Sizes of the random nonce and the truncated HMAC-SHA256 in a state token
+_STATE_NONCE_BYTES = 16
+_STATE_MAC_BYTES = 16
+
+# Salt deriving the state signing key from cookie_secret
+_STATE_KEY_SALT = b"fieldmap.oauth-state"
+
+# Token refreshes shared across sessions (e.g. several browser tabs signed in
+# as the same user), keyed by refresh token: each entry holds the lock that
+# serializes the refresh, the number of callers using it and the last
+# refreshed token info, so only the first caller actually refreshes
+_shared_refreshes: Dict[str, Dict[str, Any]] = {}
+_shared_refreshes_guard = threading.Lock()
+
+
+def _get_http_session():
+    """
+    Get the process-wide pooled HTTP session for Google endpoints.
+    
+    Returns:
+        requests.Session: Session with a connection pool mounted for https
+    """
+    global _http_session
+    with _http_session_guard:
+        if _http_session is None:
+            _http_session = requests.Session()
+            _http_session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=16))
+    return _http_session
+
+
+def _get_auth_request():
+    """
+    Get a google-auth transport request backed by the shared HTTP session.
+    
+    google-auth doesn't pass a timeout when refreshing tokens, so requests
+    would otherwise wait up to its 120 second default.
+    
+    Returns:
+        callable: google.auth.transport.requests.Request using a pooled session,
+            with _HTTP_TIMEOUT as the default timeout
+    """
+    return functools.partial(Request(session=_get_http_session()), timeout=_HTTP_TIMEOUT)
+
 
 def get_oauth_config() -> Optional[Dict[str, str]]:
     """
     Get OAuth configuration from Streamlit secrets.
     
+    Secrets are fixed for the lifetime of the process, so a complete config is
+    loaded once and shared; callers must not mutate it. A missing config is
+    not cached, so it is picked up as soon as the secrets become available.
+    
+    Returns:
+        dict: OAuth config with client_id, client_secret, redirect_uri, cookie_secret
+        None: If not configured
+    """
+    global _oauth_config
+    if _oauth_config is None:
+        _oauth_config = _load_oauth_config()
+    return _oauth_config
+
+
+def _load_oauth_config() -> Optional[Dict[str, str]]:
+    """
+    Read and validate the [auth] section of Streamlit secrets.
+    
     Returns:
         dict: OAuth config with client_id, client_secret, redirect_uri, cookie_secret
         None: If not configured
@@ -45,22 +164,127 @@ def get_oauth_config() -> Optional[Dict[str, str]]:
         return None
 
 
-def init_oauth_flow():
+@functools.lru_cache(maxsize=2)
+def _get_state_hmac(cookie_secret: str):
     """
-    Initialize Google OAuth flow for user authentication.
+    Get an HMAC-SHA256 object keyed for signing OAuth state tokens.
+    
+    The key is derived from the secret with a fixed salt, so state signatures
+    can't be confused with anything else signed by cookie_secret. Key
+    derivation and keying are done once per secret; callers copy() the result
+    and feed it the payload, so each signature is a single hash pass.
+    
+    Args:
+        cookie_secret: Configured signing secret
     
     Returns:
-        Flow: Google OAuth flow object
-        str: Generated state token for CSRF protection
+        hmac.HMAC: Keyed HMAC with no data fed yet (must not be updated)
+    """
+    state_key = hmac.new(cookie_secret.encode("utf-8"), _STATE_KEY_SALT, hashlib.sha256).digest()
+    return hmac.new(state_key, digestmod=hashlib.sha256)
+
+
+def _sign_state(payload: bytes) -> bytes:
+    """
+    Compute the truncated HMAC signature of an OAuth state payload.
+    
+    Args:
+        payload: Nonce and issue time part of the state token
+    
+    Returns:
+        bytes: First _STATE_MAC_BYTES of HMAC-SHA256(payload), keyed by cookie_secret
+    """
+    oauth_config = get_oauth_config()
+    if not oauth_config:
+        raise ValueError("OAuth configuration not found")
+    
+    mac = _get_state_hmac(oauth_config["cookie_secret"]).copy()
+    mac.update(payload)
+    return mac.digest()[:_STATE_MAC_BYTES]
+
+
+def create_state_token() -> str:
+    """
+    Create a signed, timestamped OAuth state token for CSRF protection.
+    
+    The token carries its own signature, so the callback can verify it without
+    server-side storage (the redirect back from Google starts a new Streamlit
+    session, so nothing stored in session state survives it).
+    
+    Returns:
+        str: URL-safe base64 of nonce + 5-byte issue time + signature
+    """
+    payload = secrets.token_bytes(_STATE_NONCE_BYTES) + int(time.time()).to_bytes(5, "big")
+    token = base64.urlsafe_b64encode(payload + _sign_state(payload))
+    return token.rstrip(b"=").decode("ascii")
+
+
+def verify_state_token(state: Optional[str]) -> bool:
+    """
+    Check that an OAuth state token was issued by this app and is not expired.
+    
+    Args:
+        state: State token returned by Google in the callback
+    
+    Returns:
+        bool: True if the signature matches and the token is recent enough
+    """
+    if not state:
+        return False
+    
+    try:
+        raw = base64.urlsafe_b64decode(state + "=" * (-len(state) % 4))
+    except ValueError:
+        return False
+    
+    if len(raw) != _STATE_NONCE_BYTES + 5 + _STATE_MAC_BYTES:
+        return False
+    
+    payload, signature = raw[:-_STATE_MAC_BYTES], raw[-_STATE_MAC_BYTES:]
+    if not hmac.compare_digest(signature, _sign_state(payload)):
+        return False
+    
+    issued_at = int.from_bytes(payload[_STATE_NONCE_BYTES:], "big")
+    return 0 <= time.time() - issued_at <= _STATE_MAX_AGE_SECONDS
+
+
+@functools.lru_cache(maxsize=1)
+def _get_flow_class():
+    """
+    Import the OAuth Flow class on first use.
+    
+    google_auth_oauthlib pulls in requests-oauthlib and oauthlib, so it is
+    only imported once a flow is actually needed (not when config is missing).
+    
+    Returns:
+        type: google_auth_oauthlib.flow.Flow
     """
     from google_auth_oauthlib.flow import Flow
     
+    return Flow
+
+
+def init_oauth_flow(state: Optional[str] = None):
+    """
+    Initialize Google OAuth flow for user authentication.
+    
+    The flow is cheap to rebuild and holds an HTTP session, so it is never
+    stored in session state; the signed state token is self-verifying.
+    
+    Args:
+        state: Existing state token (e.g. from the callback). A new one is
+            generated when omitted.
+    
+    Returns:
+        Flow: Google OAuth flow object
+        str: State token for CSRF protection
+    """
     oauth_config = get_oauth_config()
     if not oauth_config:
         raise ValueError("OAuth configuration not found")
     
     # Create flow with Drive scope for user OAuth
-    flow = Flow.from_client_config(
+    flow = _get_flow_class().from_client_config(
         {
             "web": {
                 "client_id": oauth_config["client_id"],
@@ -70,29 +294,34 @@ def init_oauth_flow():
                 "redirect_uris": [oauth_config["redirect_uri"]],
             }
         },
-        scopes=[
-            "https://www.googleapis.com/auth/drive.file",  # Create and manage files
-            "https://www.googleapis.com/auth/userinfo.email",  # User email
-            "openid",  # OpenID Connect
-        ],
+        scopes=list(OAUTH_SCOPES),
+        state=state,
     )
     
     flow.redirect_uri = oauth_config["redirect_uri"]
     
-    # Generate state token for CSRF protection
-    state = secrets.token_urlsafe(32)
+    # The flow's OAuth2Session holds this user's token, so it can't be shared,
+    # but its token requests can reuse the process-wide connection pool
+    flow.oauth2session.mount("https://", _get_http_session().get_adapter("https://"))
+    
+    # Generate signed state token for CSRF protection
+    if state is None:
+        state = create_state_token()
     
     return flow, state
 
 
-def get_authorization_url() -> tuple[str, str]:
+def get_authorization_url(state: Optional[str] = None) -> tuple[str, str]:
     """
     Generate Google OAuth authorization URL.
     
+    Args:
+        state: State token to use. A new signed one is generated when omitted.
+    
     Returns:
         tuple: (authorization_url, state_token)
     """
-    flow, state = init_oauth_flow()
+    flow, state = init_oauth_flow(state=state)
     authorization_url, _ = flow.authorization_url(
         access_type="offline",  # Request refresh token
         include_granted_scopes="true",
@@ -112,43 +341,35 @@ def exchange_code_for_tokens(code: str, state: str) -> Optional[Dict[str, Any]]:
         state: State token for verification
     
     Returns:
-        dict: Token info with access_token, refresh_token, etc.
+        dict: Authorized user info (``Credentials.to_json()`` fields such as
+            token, refresh_token and expiry) plus the user's email and name
         None: If exchange fails
     """
     try:
-        flow, _ = init_oauth_flow()
+        flow, _ = init_oauth_flow(state=state)
         
         # Exchange code for tokens
-        flow.fetch_token(code=code)
+        flow.fetch_token(code=code, timeout=_HTTP_TIMEOUT)
         
         credentials = flow.credentials
         
-        # Extract token info
-        token_info = {
-            "access_token": credentials.token,
-            "refresh_token": credentials.refresh_token,
-            "token_uri": credentials.token_uri,
-            "client_id": credentials.client_id,
-            "client_secret": credentials.client_secret,
-            "scopes": credentials.scopes,
-            "expiry": credentials.expiry.isoformat() if credentials.expiry else None,
-        }
+        # Extract token info in the library's authorized user format
+        token_info = json.loads(credentials.to_json())
         
-        # Get user info
-        from google.oauth2.credentials import Credentials
-        from googleapiclient.discovery import build
-        
-        user_credentials = Credentials(
-            token=token_info["access_token"],
-            refresh_token=token_info["refresh_token"],
-            token_uri=token_info["token_uri"],
-            client_id=token_info["client_id"],
-            client_secret=token_info["client_secret"],
-            scopes=token_info["scopes"],
-        )
-        
-        oauth2_service = build("oauth2", "v2", credentials=user_credentials)
-        user_info = oauth2_service.userinfo().get().execute()
+        # Get user info from the ID token returned with the tokens ("openid"
+        # scope). It came straight from Google's token endpoint over TLS, so
+        # its claims can be read without a signature check or userinfo call.
+        user_info = {}
+        if credentials.id_token:
+            user_info = jwt.decode(credentials.id_token, verify=False)
+        if not user_info.get("email"):
+            response = _get_http_session().get(
+                _USERINFO_URL,
+                headers={"Authorization": f"Bearer {credentials.token}"},
+                timeout=_HTTP_TIMEOUT,
+            )
+            response.raise_for_status()
+            user_info = response.json()
         
         token_info["email"] = user_info.get("email")
         token_info["name"] = user_info.get("name")
@@ -160,6 +381,35 @@ def exchange_code_for_tokens(code: str, state: str) -> Optional[Dict[str, Any]]:
         return None
 
 
+def _stamp_expiry(token_info: Dict[str, Any]):
+    """
+    Record the access token expiry as a POSIX timestamp on the token info.
+    
+    Args:
+        token_info: Token information dict (updated in place)
+    """
+    expiry = token_info.get("expiry")
+    token_info["_expiry_ts"] = (
+        datetime.strptime(expiry.rstrip("Z").split(".")[0], "%Y-%m-%dT%H:%M:%S")
+        .replace(tzinfo=timezone.utc)
+        .timestamp()
+        if expiry else 0.0
+    )
+
+
+def _token_is_fresh(token_info: Dict[str, Any]) -> bool:
+    """
+    Check whether the stored access token is comfortably before its expiry.
+    
+    Args:
+        token_info: Token information dict
+    
+    Returns:
+        bool: True if the token doesn't need a refresh yet
+    """
+    return token_info.get("_expiry_ts", 0.0) > time.time() + _EXPIRY_SKEW_SECONDS
+
+
 def save_tokens_to_session(token_info: Dict[str, Any]):
     """
     Save OAuth tokens to session state.
@@ -167,48 +417,111 @@ def save_tokens_to_session(token_info: Dict[str, Any]):
     Args:
         token_info: Token information dict
     """
-    st.session_state["oauth_tokens"] = token_info
-    st.session_state["user_email"] = token_info.get("email")
-    st.session_state["user_name"] = token_info.get("name")
-    st.session_state["logged_in"] = True
+    _stamp_expiry(token_info)
+    st.session_state[_AUTH_SESSION_KEY] = {
+        "tokens": token_info,
+        "email": token_info.get("email"),
+        "name": token_info.get("name"),
+    }
     
     logger.info(f"User authenticated: {token_info.get('email')}")
 
 
+def _build_credentials(auth_state: Dict[str, Any]):
+    """
+    Build Credentials from stored token info and memoize them in the auth state.
+    
+    Args:
+        auth_state: The session's auth state dict
+    
+    Returns:
+        Credentials: Google OAuth credentials object
+    """
+    # Restores the access token expiry so expired tokens get refreshed
+    credentials = Credentials.from_authorized_user_info(auth_state["tokens"])
+    auth_state["credentials"] = credentials
+    return credentials
+
+
+def _refresh_token_info(credentials) -> Dict[str, Any]:
+    """
+    Refresh credentials once for every session sharing their refresh token.
+    
+    The first caller refreshes and publishes the new token info; callers
+    waiting on the same refresh token then reuse it while it is still fresh.
+    Entries nobody is using are evicted once their token goes stale.
+    
+    Args:
+        credentials: Expired Credentials with a refresh token
+    
+    Returns:
+        dict: Refreshed token information with its expiry stamped
+    """
+    refresh_token = credentials.refresh_token
+    with _shared_refreshes_guard:
+        for key, stale in list(_shared_refreshes.items()):
+            if not stale["users"] and not (stale["tokens"] and _token_is_fresh(stale["tokens"])):
+                del _shared_refreshes[key]
+        entry = _shared_refreshes.setdefault(
+            refresh_token, {"lock": threading.Lock(), "users": 0, "tokens": None}
+        )
+        entry["users"] += 1
+    
+    try:
+        with entry["lock"]:
+            if not (entry["tokens"] and _token_is_fresh(entry["tokens"])):
+                credentials.refresh(_get_auth_request())
+                token_info = json.loads(credentials.to_json())
+                _stamp_expiry(token_info)
+                entry["tokens"] = token_info
+            return dict(entry["tokens"])
+    finally:
+        with _shared_refreshes_guard:
+            entry["users"] -= 1
+
+
 def get_user_credentials():
     """
     Get Google credentials from stored OAuth tokens.
     
+    The Credentials object is built once per sign-in and kept in session
+    state, so reruns reuse it instead of reconstructing it. Refreshes update
+    it in place, so it stays the same object for the whole sign-in.
+    
     Returns:
         Credentials: Google OAuth credentials object
         None: If not authenticated
     """
-    from google.oauth2.credentials import Credentials
-    
-    token_info = st.session_state.get("oauth_tokens")
-    if not token_info:
+    auth_state = st.session_state.get(_AUTH_SESSION_KEY)
+    if not auth_state:
         return None
+    token_info = auth_state["tokens"]
     
     try:
-        credentials = Credentials(
-            token=token_info.get("access_token"),
-            refresh_token=token_info.get("refresh_token"),
-            token_uri=token_info.get("token_uri"),
-            client_id=token_info.get("client_id"),
-            client_secret=token_info.get("client_secret"),
-            scopes=token_info.get("scopes"),
-        )
+        credentials = auth_state.get("credentials") or _build_credentials(auth_state)
+        
+        # Check if token needs refresh (skip the expiry math for fresh tokens)
+        if _token_is_fresh(token_info):
+            return credentials
+        
+        if not credentials.expired:
+            # Still valid, possibly because the Drive client's transport already
+            # refreshed it; record the new expiry so the fast path applies again
+            if credentials.token != token_info.get("token"):
+                token_info.update(json.loads(credentials.to_json()))
+                _stamp_expiry(token_info)
+            return credentials
         
-        # Check if token needs refresh
         if credentials.expired and credentials.refresh_token:
-            from google.auth.transport.requests import Request
-            credentials.refresh(Request())
-            
-            # Update stored tokens
-            token_info["access_token"] = credentials.token
-            if credentials.expiry:
-                token_info["expiry"] = credentials.expiry.isoformat()
-            st.session_state["oauth_tokens"] = token_info
+            # Another session may already have refreshed this token. Apply it to
+            # the existing object rather than building a new one: the Drive
+            # client holds this object, and a new one would look like a new
+            # sign-in to the app
+            token_info.update(_refresh_token_info(credentials))
+            credentials.token = token_info["token"]
+            credentials.expiry = datetime.fromtimestamp(
+                token_info["_expiry_ts"], timezone.utc
+            ).replace(tzinfo=None)
         
         return credentials
         
@@ -221,20 +534,29 @@ def is_authenticated() -> bool:
     """
     Check if user is authenticated.
     
+    A token well before its expiry is accepted with a timestamp compare;
+    only near or past expiry are credentials built (and refreshed).
+    
     Returns:
         bool: True if user is authenticated, False otherwise
     """
-    return st.session_state.get("logged_in", False) and st.session_state.get("oauth_tokens") is not None
+    auth_state = st.session_state.get(_AUTH_SESSION_KEY)
+    if not auth_state:
+        return False
+    
+    if _token_is_fresh(auth_state["tokens"]):
+        return True
+    
+    credentials = get_user_credentials()
+    return credentials is not None and credentials.valid
 
 
 def logout():
     """
     Clear authentication state.
     """
-    keys_to_clear = ["oauth_tokens", "user_email", "user_name", "logged_in"]
-    for key in keys_to_clear:
-        if key in st.session_state:
-            del st.session_state[key]
+    for key in _LOGOUT_SESSION_KEYS:
+        st.session_state.pop(key, None)
     
     logger.info("User logged out")
 
@@ -247,7 +569,8 @@ def get_user_email() -> Optional[str]:
         str: User email
         None: If not authenticated
     """
-    return st.session_state.get("user_email")
+    auth_state = st.session_state.get(_AUTH_SESSION_KEY)
+    return auth_state.get("email") if auth_state else None
 
 
 def get_user_name() -> Optional[str]:
@@ -258,4 +581,5 @@ def get_user_name() -> Optional[str]:
         str: User name
         None: If not authenticated
     """
-    return st.session_state.get("user_name")
+    auth_state = st.session_state.get(_AUTH_SESSION_KEY)
+    return auth_state.get("name") if auth_state else None
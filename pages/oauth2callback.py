@@ -5,7 +5,6 @@ This page handles the OAuth redirect from Google and exchanges the authorization
 
 import streamlit as st
 import logging
-from urllib.parse import parse_qs, urlparse
 
 # Import OAuth utilities
 import sys
@@ -15,7 +14,7 @@ from pathlib import Path
 parent_dir = Path(__file__).parent.parent
 sys.path.insert(0, str(parent_dir))
 
-from oauth_utils import exchange_code_for_tokens, save_tokens_to_session
+from oauth_utils import exchange_code_for_tokens, save_tokens_to_session, verify_state_token
 
 logger = logging.getLogger(__name__)
 
@@ -39,45 +38,43 @@ code = query_params.get("code")
 state = query_params.get("state")
 error = query_params.get("error")
 
-if error:
-    st.error(f"❌ Authentication Error: {error}")
-    st.info("Please close this page and try signing in again.")
-    st.stop()
+# Streamlit can rerun this page after the code was exchanged (and the query
+# params cleared); authorization codes are single-use, so don't retry it
+handled_code = st.session_state.get("_oauth_handled_code")
+callback_handled = handled_code is not None and code in (None, handled_code)
 
-if not code:
-    st.error("❌ No authorization code received")
-    st.info("Please close this page and try signing in again.")
-    st.stop()
-
-# Show processing message
-with st.spinner("🔐 Completing sign in..."):
-    # Verify state token (stored in session state from authorization request)
-    expected_state = st.session_state.get("oauth_state")
-    
-    if not expected_state:
-        st.error("❌ OAuth state not found in session")
-        st.info("Please close this page and try signing in again.")
-        st.stop()
-    
-    if state != expected_state:
-        st.error("❌ Invalid OAuth state - possible CSRF attack")
+if not callback_handled:
+    if error:
+        st.error(f"❌ Authentication Error: {error}")
         st.info("Please close this page and try signing in again.")
         st.stop()
     
-    # Exchange code for tokens
-    token_info = exchange_code_for_tokens(code, state)
-    
-    if not token_info:
-        st.error("❌ Failed to complete authentication")
+    if not code:
+        st.error("❌ No authorization code received")
         st.info("Please close this page and try signing in again.")
         st.stop()
     
-    # Save tokens to session
-    save_tokens_to_session(token_info)
+    # Show processing message
+    with st.spinner("🔐 Completing sign in..."):
+        # Verify the signed state token issued with the authorization request
+        if not verify_state_token(state):
+            st.error("❌ Invalid or expired OAuth state - possible CSRF attack")
+            st.info("Please close this page and try signing in again.")
+            st.stop()
+        
+        # Exchange code for tokens
+        token_info = exchange_code_for_tokens(code, state)
+        
+        if not token_info:
+            st.error("❌ Failed to complete authentication")
+            st.info("Please close this page and try signing in again.")
+            st.stop()
+        
+        # Save tokens to session
+        save_tokens_to_session(token_info)
     
-    # Clear state token
-    if "oauth_state" in st.session_state:
-        del st.session_state["oauth_state"]
+    st.session_state["_oauth_handled_code"] = code
+    st.query_params.clear()
 
 # Success! Redirect to main app
 st.success("✅ Sign in successful!")
@@ -4,15 +4,95 @@ Uses Google Drive with service account for server-to-server authentication.
 """
 
 from abc import ABC, abstractmethod
+from concurrent.futures import Future, ThreadPoolExecutor
+import functools
+import hashlib
 from PIL import Image
 import io
 from typing import Optional
 import logging
 import json
 
+try:
+    # orjson is an optional C-accelerated JSON library
+    import orjson
+    
+    _json_loads = orjson.loads
+    
+    def _json_dumps(obj) -> bytes:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2)
+except ImportError:
+    _json_loads = json.loads
+    
+    def _json_dumps(obj) -> bytes:
+        return json.dumps(obj, indent=2).encode('utf-8')
+
+try:
+    from google_auth_httplib2 import AuthorizedHttp
+    from googleapiclient.discovery import build_from_document
+    from googleapiclient.discovery_cache import get_static_doc
+    from googleapiclient.errors import HttpError
+    from googleapiclient.http import MediaIoBaseDownload, MediaIoBaseUpload, build_http
+except ImportError:
+    # Google API libraries are only needed once Drive storage is used;
+    # _get_drive_discovery reports them missing
+    AuthorizedHttp = None
+    build_from_document = None
+    get_static_doc = None
+    MediaIoBaseDownload = None
+    MediaIoBaseUpload = None
+    build_http = None
+    
+    class HttpError(Exception):
+        """Stand-in so ``except HttpError`` clauses work without googleapiclient"""
+
 # Configure logger for this module
 logger = logging.getLogger(__name__)
 
+# Socket timeout for Drive requests, so a stalled connection fails the
+# request instead of hanging the rerun
+DRIVE_HTTP_TIMEOUT_SECONDS = 30
+
+# Largest upload Drive accepts as a simple (single request) upload
+SIMPLE_UPLOAD_MAX_BYTES = 5 * 1024 * 1024
+
+
+@functools.lru_cache(maxsize=1)
+def _get_drive_discovery():
+    """
+    Load the Drive v3 discovery document bundled with googleapiclient, once per process.
+    
+    Returns:
+        str: Discovery document JSON
+    
+    Raises:
+        ImportError: If the Google API client libraries are not installed
+    """
+    if get_static_doc is None:
+        raise ImportError(
+            "Google API libraries not installed. "
+            "Install with: pip install google-auth google-auth-httplib2 google-api-python-client"
+        )
+    return get_static_doc('drive', 'v3')
+
+
+@functools.lru_cache(maxsize=1)
+def _get_configured_root_folder_id() -> Optional[str]:
+    """
+    Read the optional DRIVE_ROOT_FOLDER_ID from Streamlit secrets, once per process.
+    
+    Errors reading the secrets propagate (and are not cached), so the lookup
+    is retried on the next call.
+    
+    Returns:
+        str: Configured root folder ID
+        None: If not configured
+    """
+    import streamlit as st
+    if "auth" in st.secrets and "DRIVE_ROOT_FOLDER_ID" in st.secrets["auth"]:
+        return st.secrets["auth"]["DRIVE_ROOT_FOLDER_ID"] or None
+    return None
+
 
 class PhotoStorage(ABC):
     """Abstract base class for photo storage backends"""
@@ -78,22 +158,36 @@ class GoogleDriveStorage(PhotoStorage):
         self.folder_cache = {}  # Cache folder IDs
         self.index_cache = None  # Cache for index.json
         self.root_folder_id = None  # Fieldmap root folder ID
+        self.listed_parents = set()  # Parent folder IDs whose subfolders are cached
+        self.file_cache = {}  # Cache file IDs in listed folders
+        self.listed_folders = set()  # Folder IDs whose files are cached
+        self.index_writer = None  # Background executor for index.json uploads
+        self.index_writer_service = None  # Drive service owned by the index writer thread
+        self.index_digest = None  # SHA-256 of the last index.json uploaded
+        self.index_file_id = None  # Drive file ID of index.json once known
+    
+    def _build_service(self):
+        """Build a Google Drive service using user OAuth credentials."""
+        discovery_doc = _get_drive_discovery()
+        
+        # One keep-alive httplib2 connection per service, reused by all of its
+        # requests; build_http keeps googleapiclient's redirect handling
+        http = build_http()
+        http.timeout = DRIVE_HTTP_TIMEOUT_SECONDS
+        
+        # Build service with user credentials from the discovery document bundled
+        # with googleapiclient, read from disk once per process
+        return build_from_document(
+            discovery_doc,
+            http=AuthorizedHttp(self.credentials, http=http)
+        )
     
     def _get_service(self):
         """Get or create Google Drive service using user OAuth credentials."""
         if self.service:
             return self.service
         
-        try:
-            from googleapiclient.discovery import build
-        except ImportError:
-            raise ImportError(
-                "Google API libraries not installed. "
-                "Install with: pip install google-auth google-auth-httplib2 google-api-python-client"
-            )
-        
-        # Build service with user credentials
-        self.service = build('drive', 'v3', credentials=self.credentials)
+        self.service = self._build_service()
         return self.service
     
     def _get_root_folder_id(self) -> str:
@@ -108,15 +202,12 @@ class GoogleDriveStorage(PhotoStorage):
             return self.root_folder_id
         
         # Check if DRIVE_ROOT_FOLDER_ID is provided in secrets
-        import streamlit as st
-        drive_root_id = None
         try:
-            if "auth" in st.secrets and "DRIVE_ROOT_FOLDER_ID" in st.secrets["auth"]:
-                drive_root_id = st.secrets["auth"]["DRIVE_ROOT_FOLDER_ID"]
-                if drive_root_id:
-                    logger.info(f"Using provided DRIVE_ROOT_FOLDER_ID: {drive_root_id}")
-                    self.root_folder_id = drive_root_id
-                    return drive_root_id
+            drive_root_id = _get_configured_root_folder_id()
+            if drive_root_id:
+                logger.info(f"Using provided DRIVE_ROOT_FOLDER_ID: {drive_root_id}")
+                self.root_folder_id = drive_root_id
+                return drive_root_id
         except Exception as e:
             logger.warning(f"Could not read DRIVE_ROOT_FOLDER_ID from secrets: {e}")
         
@@ -158,20 +249,30 @@ class GoogleDriveStorage(PhotoStorage):
         if cache_key in self.folder_cache:
             return self.folder_cache[cache_key]
         
-        service = self._get_service()
-        
-        # Search for existing folder
-        query = f"name='{folder_name}' and mimeType='application/vnd.google-apps.folder' and trashed=false"
-        if parent_id:
-            query += f" and '{parent_id}' in parents"
+        # Resolve all sibling folders with one query instead of one per name
+        if parent_id and parent_id not in self.listed_parents:
+            self._cache_child_folders(parent_id)
+            if cache_key in self.folder_cache:
+                return self.folder_cache[cache_key]
         
-        results = service.files().list(
-            q=query,
-            spaces='drive',
-            fields='files(id, name)'
-        ).execute()
+        service = self._get_service()
         
-        files = results.get('files', [])
+        # A complete listing of the parent already showed the folder is
+        # missing, so only search when there is no such listing
+        files = []
+        if not parent_id or parent_id not in self.listed_parents:
+            query = f"name='{folder_name}' and mimeType='application/vnd.google-apps.folder' and trashed=false"
+            if parent_id:
+                query += f" and '{parent_id}' in parents"
+            
+            results = service.files().list(
+                q=query,
+                spaces='drive',
+                fields='files(id)',
+                pageSize=1
+            ).execute()
+            
+            files = results.get('files', [])
         
         if files:
             folder_id = files[0]['id']
@@ -193,19 +294,122 @@ class GoogleDriveStorage(PhotoStorage):
         self.folder_cache[cache_key] = folder_id
         return folder_id
     
+    def _cache_child_folders(self, parent_id: str):
+        """
+        Cache the IDs of all folders directly under a parent folder.
+        
+        Args:
+            parent_id: ID of the parent folder
+        """
+        children = self._list_children(parent_id, folders=True)
+        if children is None:
+            return
+        
+        for name, folder_id in children.items():
+            self.folder_cache.setdefault(f"{parent_id}:{name}", folder_id)
+        self.listed_parents.add(parent_id)
+    
+    def _find_file(self, file_name: str, folder_id: str) -> Optional[str]:
+        """
+        Find a (non-folder) file by name in a folder.
+        
+        The folder's files are listed once and cached, so saving many photos to
+        a session folder doesn't cost an existence query per photo.
+        
+        Args:
+            file_name: Name of the file
+            folder_id: ID of the folder to look in
+        
+        Returns:
+            str: File ID
+            None: If no such file exists
+        """
+        if folder_id not in self.listed_folders:
+            children = self._list_children(folder_id, folders=False)
+            if children is None:
+                # Listing failed; fall back to looking up just this file
+                query = f"name='{file_name}' and '{folder_id}' in parents and trashed=false"
+                results = self._get_service().files().list(
+                    q=query,
+                    spaces='drive',
+                    fields='files(id)',
+                    pageSize=1
+                ).execute()
+                files = results.get('files', [])
+                return files[0]['id'] if files else None
+            
+            for name, file_id in children.items():
+                self.file_cache.setdefault(f"{folder_id}:{name}", file_id)
+            self.listed_folders.add(folder_id)
+        
+        return self.file_cache.get(f"{folder_id}:{file_name}")
+    
+    def _forget_file(self, file_id: str):
+        """
+        Drop a file from the file cache after it was moved or deleted.
+        
+        Args:
+            file_id: Google Drive file ID
+        """
+        for key in [key for key, cached_id in self.file_cache.items() if cached_id == file_id]:
+            del self.file_cache[key]
+    
+    def _list_children(self, parent_id: str, folders: bool) -> Optional[dict]:
+        """
+        List the folders or files directly under a parent folder.
+        
+        Args:
+            parent_id: ID of the parent folder
+            folders: True to list subfolders, False to list other files
+        
+        Returns:
+            dict: Child names mapped to their IDs (first match wins)
+            None: If listing failed
+        """
+        service = self._get_service()
+        operator = '=' if folders else '!='
+        query = (
+            f"'{parent_id}' in parents and "
+            f"mimeType{operator}'application/vnd.google-apps.folder' and trashed=false"
+        )
+        
+        try:
+            children = {}
+            page_token = None
+            while True:
+                results = service.files().list(
+                    q=query,
+                    spaces='drive',
+                    fields='nextPageToken, files(id, name)',
+                    pageSize=1000,
+                    pageToken=page_token
+                ).execute()
+                
+                for child in results.get('files', []):
+                    children.setdefault(child['name'], child['id'])
+                
+                page_token = results.get('nextPageToken')
+                if not page_token:
+                    return children
+        except Exception as e:
+            logger.warning(f"Failed to list contents of {parent_id}: {e}")
+            return None
+    
     def load_index(self) -> dict:
         """
         Load the metadata index from Google Drive.
         
         Returns:
             dict: Index data with sessions and photo records
+        
+        Raises:
+            Exception: If the index can't be read from Drive; the failure is
+                not cached, so the next call tries again
         """
         if self.index_cache is not None:
             return self.index_cache
         
         try:
-            from googleapiclient.http import MediaIoBaseDownload
-            
             service = self._get_service()
             
             # Get or create Fieldmap folder
@@ -216,7 +420,8 @@ class GoogleDriveStorage(PhotoStorage):
             results = service.files().list(
                 q=query,
                 spaces='drive',
-                fields='files(id, name)'
+                fields='files(id)',
+                pageSize=1
             ).execute()
             
             files = results.get('files', [])
@@ -224,6 +429,7 @@ class GoogleDriveStorage(PhotoStorage):
             if files:
                 # Load existing index
                 file_id = files[0]['id']
+                self.index_file_id = file_id
                 request = service.files().get_media(fileId=file_id)
                 fh = io.BytesIO()
                 downloader = MediaIoBaseDownload(fh, request)
@@ -232,8 +438,7 @@ class GoogleDriveStorage(PhotoStorage):
                 while not done:
                     status, done = downloader.next_chunk()
                 
-                fh.seek(0)
-                index_data = json.load(fh)
+                index_data = _json_loads(fh.getvalue())
                 self.index_cache = index_data
                 return index_data
             else:
@@ -247,11 +452,7 @@ class GoogleDriveStorage(PhotoStorage):
                 return index_data
         except Exception as e:
             logger.warning(f"Failed to load index from Drive: {e}")
-            return {
-                'sessions': {},
-                'photo_counter': 0,
-                'version': '1.0'
-            }
+            raise
     
     def save_index(self, index_data: dict) -> bool:
         """
@@ -264,35 +465,117 @@ class GoogleDriveStorage(PhotoStorage):
             bool: True if successful, False otherwise
         """
         try:
-            from googleapiclient.http import MediaIoBaseUpload
-            
-            service = self._get_service()
-            
-            # Get or create Fieldmap folder
             fieldmap_folder_id = self._get_root_folder_id()
-            
+        except Exception as e:
+            logger.error(f"Failed to save index to Drive: {e}")
+            return False
+        
+        if not self._upload_index(index_data, self._get_service(), fieldmap_folder_id):
+            return False
+        
+        # Update cache
+        self.index_cache = index_data
+        return True
+    
+    def save_index_async(self, index_data: dict) -> Future:
+        """
+        Save the metadata index to Google Drive on a background thread.
+        
+        The cache is updated immediately so reads see the new index, and
+        uploads run one at a time in submission order, so the last queued
+        index is the one left in Drive.
+        
+        Args:
+            index_data: dict with sessions and photo records
+        
+        Returns:
+            Future: Resolves to True if the upload succeeded, False otherwise
+        """
+        # Resolve the root folder here, on the calling thread, so the writer
+        # never touches the main Drive service, the folder caches or st.secrets
+        fieldmap_folder_id = self._get_root_folder_id()
+        self.index_cache = index_data
+        
+        if self.index_writer is None:
+            self.index_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="fieldmap-index")
+        return self.index_writer.submit(self._upload_index_in_background, index_data, fieldmap_folder_id)
+    
+    def flush_index_writes(self):
+        """
+        Wait for queued index uploads to finish and stop the index writer.
+        
+        Call this before the backend is replaced, so the next backend reads the
+        index this one last queued rather than an older copy from Drive.
+        """
+        if self.index_writer is not None:
+            self.index_writer.shutdown(wait=True)
+            self.index_writer = None
+    
+    def _upload_index_in_background(self, index_data: dict, fieldmap_folder_id: str) -> bool:
+        """
+        Upload the index from the index writer thread.
+        
+        httplib2 connections are not thread-safe, so the writer thread uses its
+        own Drive service rather than the one shared by the main thread.
+        
+        Args:
+            index_data: dict with sessions and photo records
+            fieldmap_folder_id: ID of the Fieldmap root folder
+        
+        Returns:
+            bool: True if successful, False otherwise
+        """
+        if self.index_writer_service is None:
+            self.index_writer_service = self._build_service()
+        return self._upload_index(index_data, self.index_writer_service, fieldmap_folder_id)
+    
+    def _upload_index(self, index_data: dict, service, fieldmap_folder_id: str) -> bool:
+        """
+        Write index.json to the Fieldmap folder.
+        
+        Args:
+            index_data: dict with sessions and photo records
+            service: Drive service to issue the requests with
+            fieldmap_folder_id: ID of the Fieldmap root folder
+        
+        Returns:
+            bool: True if successful, False otherwise
+        """
+        try:
             # Convert index to JSON bytes
-            index_json = json.dumps(index_data, indent=2)
-            index_bytes = io.BytesIO(index_json.encode('utf-8'))
+            index_json = _json_dumps(index_data)
             
-            # Search for existing index.json
-            query = f"name='index.json' and '{fieldmap_folder_id}' in parents and trashed=false"
-            results = service.files().list(
-                q=query,
-                spaces='drive',
-                fields='files(id, name)'
-            ).execute()
+            # Nothing to upload if Drive already has this exact index
+            digest = hashlib.sha256(index_json).hexdigest()
+            if digest == self.index_digest:
+                return True
+            index_bytes = io.BytesIO(index_json)
             
-            files = results.get('files', [])
+            # Search for existing index.json, unless its ID is already known
+            # from an earlier load or save
+            if self.index_file_id is None:
+                query = f"name='index.json' and '{fieldmap_folder_id}' in parents and trashed=false"
+                results = service.files().list(
+                    q=query,
+                    spaces='drive',
+                    fields='files(id)',
+                    pageSize=1
+                ).execute()
+                
+                files = results.get('files', [])
+                if files:
+                    self.index_file_id = files[0]['id']
             
-            media = MediaIoBaseUpload(index_bytes, mimetype='application/json', resumable=True)
+            # The index is small, so a single simple upload avoids the extra
+            # round-trip needed to open a resumable upload session
+            media = MediaIoBaseUpload(index_bytes, mimetype='application/json', resumable=False)
             
-            if files:
+            if self.index_file_id:
                 # Update existing file
-                file_id = files[0]['id']
                 service.files().update(
-                    fileId=file_id,
-                    media_body=media
+                    fileId=self.index_file_id,
+                    media_body=media,
+                    fields='id'
                 ).execute()
             else:
                 # Create new file
@@ -301,16 +584,18 @@ class GoogleDriveStorage(PhotoStorage):
                     'parents': [fieldmap_folder_id],
                     'mimeType': 'application/json'
                 }
-                service.files().create(
+                created = service.files().create(
                     body=file_metadata,
                     media_body=media,
                     fields='id'
                 ).execute()
+                self.index_file_id = created['id']
             
-            # Update cache
-            self.index_cache = index_data
+            self.index_digest = digest
             return True
         except Exception as e:
+            # The file may have been deleted or trashed; look it up again next time
+            self.index_file_id = None
             logger.error(f"Failed to save index to Drive: {e}")
             return False
     
@@ -326,8 +611,41 @@ class GoogleDriveStorage(PhotoStorage):
         Returns:
             Google Drive file ID (gdrive:// URI)
         """
-        from googleapiclient.http import MediaIoBaseUpload
+        # Convert image to bytes
+        img_byte_arr = io.BytesIO()
+        if pil_image.mode not in ('RGB', 'RGBA'):
+            pil_image = pil_image.convert('RGB')
+        pil_image.save(img_byte_arr, format='PNG')
+        img_byte_arr.seek(0)
+        
+        file_name = f'photo_{int(photo_id)}.png'
+        
+        try:
+            file_id = self._upload_photo(session_name, file_name, img_byte_arr)
+        except HttpError as e:
+            if e.resp.status != 404:
+                raise
+            # A cached folder or file was deleted in Drive; look them up again
+            logger.warning(f"Drive item not found while saving photo {photo_id}, retrying: {e}")
+            self._forget_cached_ids()
+            img_byte_arr.seek(0)
+            file_id = self._upload_photo(session_name, file_name, img_byte_arr)
+        
+        logger.debug("Saved photo %s to user's Drive: %s", photo_id, file_id)
+        return f"gdrive://{file_id}"
+    
+    def _upload_photo(self, session_name: str, file_name: str, img_byte_arr: io.BytesIO) -> str:
+        """
+        Upload encoded photo bytes to the session folder, replacing any existing file.
+        
+        Args:
+            session_name: Name of the session
+            file_name: Name of the photo file
+            img_byte_arr: PNG bytes positioned at the start
         
+        Returns:
+            str: Google Drive file ID
+        """
         service = self._get_service()
         
         # Get or create Fieldmap folder
@@ -336,38 +654,26 @@ class GoogleDriveStorage(PhotoStorage):
         # Get or create session folder
         session_folder_id = self._get_or_create_folder(session_name, fieldmap_folder_id)
         
-        # Convert image to bytes
-        img_byte_arr = io.BytesIO()
-        if pil_image.mode not in ('RGB', 'RGBA'):
-            pil_image = pil_image.convert('RGB')
-        pil_image.save(img_byte_arr, format='PNG')
-        img_byte_arr.seek(0)
-        
         # Upload file
-        file_name = f'photo_{int(photo_id)}.png'
         file_metadata = {
             'name': file_name,
             'parents': [session_folder_id]
         }
         
-        media = MediaIoBaseUpload(img_byte_arr, mimetype='image/png', resumable=True)
+        # Resumable uploads cost an extra round-trip to open the upload session,
+        # so only use them for images too large for a single simple upload
+        resumable = img_byte_arr.getbuffer().nbytes > SIMPLE_UPLOAD_MAX_BYTES
+        media = MediaIoBaseUpload(img_byte_arr, mimetype='image/png', resumable=resumable)
         
         # Check if file already exists
-        query = f"name='{file_name}' and '{session_folder_id}' in parents and trashed=false"
-        results = service.files().list(
-            q=query,
-            spaces='drive',
-            fields='files(id, name)'
-        ).execute()
-        
-        files = results.get('files', [])
+        file_id = self._find_file(file_name, session_folder_id)
         
-        if files:
+        if file_id:
             # Update existing file
-            file_id = files[0]['id']
-            file = service.files().update(
+            service.files().update(
                 fileId=file_id,
-                media_body=media
+                media_body=media,
+                fields='id'
             ).execute()
         else:
             # Create new file
@@ -377,9 +683,20 @@ class GoogleDriveStorage(PhotoStorage):
                 fields='id'
             ).execute()
             file_id = file.get('id')
+            if session_folder_id in self.listed_folders:
+                self.file_cache[f"{session_folder_id}:{file_name}"] = file_id
         
-        logger.info(f"Saved photo {photo_id} to user's Drive: {file_id}")
-        return f"gdrive://{file_id}"
+        return file_id
+    
+    def _forget_cached_ids(self):
+        """
+        Drop all cached folder and file IDs so they are looked up again.
+        """
+        self.root_folder_id = None
+        self.folder_cache.clear()
+        self.listed_parents.clear()
+        self.file_cache.clear()
+        self.listed_folders.clear()
     
     def load_image(self, uri: str) -> Image.Image:
         """
@@ -391,8 +708,6 @@ class GoogleDriveStorage(PhotoStorage):
         Returns:
             PIL Image object
         """
-        from googleapiclient.http import MediaIoBaseDownload
-        
         if not uri.startswith('gdrive://'):
             raise ValueError(f"Invalid Google Drive URI: {uri}")
         
@@ -408,7 +723,11 @@ class GoogleDriveStorage(PhotoStorage):
             status, done = downloader.next_chunk()
         
         fh.seek(0)
-        return Image.open(fh)
+        image = Image.open(fh)
+        # Decode now so the download buffer can be released right away
+        image.load()
+        fh.close()
+        return image
     
     def delete_image(self, uri: str) -> bool:
         """
@@ -428,6 +747,7 @@ class GoogleDriveStorage(PhotoStorage):
             service = self._get_service()
             
             service.files().delete(fileId=file_id).execute()
+            self._forget_file(file_id)
             return True
         except Exception:
             return False
@@ -457,10 +777,14 @@ class GoogleDriveStorage(PhotoStorage):
                 fileId=file_id,
                 addParents=to_folder_id,
                 removeParents=from_folder_id,
-                fields='id, parents'
+                fields='id, name, parents'
             ).execute()
             
-            logger.info(f"Moved file {file_id} from {from_session} to {to_session}")
+            self._forget_file(file_id)
+            if to_folder_id in self.listed_folders:
+                self.file_cache[f"{to_folder_id}:{file['name']}"] = file_id
+            
+            logger.debug("Moved file %s from %s to %s", file_id, from_session, to_session)
             return True
         except Exception as e:
             logger.error(f"Failed to move file {file_id}: {e}")
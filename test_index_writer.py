@@ -0,0 +1,216 @@
+"""
+Tests for the background index writer in GoogleDriveStorage.
+Runs the storage backend against a small in-memory stand-in for the Drive API.
+"""
+
+import sys
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).parent))
+
+import re
+import threading
+import time
+from unittest.mock import patch
+
+import streamlit as st
+
+import storage
+from app import App
+from storage import GoogleDriveStorage
+
+
+ROOT_FOLDER_ID = "root-folder"
+
+
+class _Request:
+    """Deferred Drive call, run on execute() like googleapiclient's HttpRequest"""
+
+    def __init__(self, run):
+        self.run = run
+
+    def execute(self, **kwargs):
+        return self.run()
+
+
+class _FakeFiles:
+    """The parts of the Drive files() resource that the index code uses"""
+
+    def __init__(self, drive):
+        self.drive = drive
+
+    def list(self, q=None, **kwargs):
+        def run():
+            name = re.search(r"name='([^']*)'", q or "")
+            parent = re.search(r"'([^']*)' in parents", q or "")
+            with self.drive.lock:
+                files = [
+                    {"id": file_id, "name": f["name"]}
+                    for file_id, f in self.drive.files.items()
+                    if (not name or f["name"] == name.group(1))
+                    and (not parent or f["parent"] == parent.group(1))
+                ]
+            return {"files": files}
+        return _Request(run)
+
+    def create(self, body=None, media_body=None, **kwargs):
+        def run():
+            data = self.drive.read_upload(media_body)
+            with self.drive.lock:
+                file_id = f"file-{len(self.drive.files) + 1}"
+                self.drive.files[file_id] = {
+                    "name": body["name"], "parent": body["parents"][0], "data": data
+                }
+            return {"id": file_id}
+        return _Request(run)
+
+    def update(self, fileId=None, media_body=None, **kwargs):
+        def run():
+            data = self.drive.read_upload(media_body)
+            with self.drive.lock:
+                self.drive.files[fileId]["data"] = data
+            return {"id": fileId}
+        return _Request(run)
+
+    def get_media(self, fileId=None, **kwargs):
+        with self.drive.lock:
+            return self.drive.files[fileId]["data"]
+
+
+class _FakeDrive:
+    """In-memory Drive service whose uploads take upload_delay seconds"""
+
+    def __init__(self, upload_delay=0.0):
+        self.files = {}
+        self.lock = threading.Lock()
+        self.upload_delay = upload_delay
+
+    def read_upload(self, media_body):
+        time.sleep(self.upload_delay)
+        return media_body.getbytes(0, media_body.size())
+
+
+class _FakeDownload:
+    """Stand-in for MediaIoBaseDownload that writes the whole file at once"""
+
+    def __init__(self, fh, data):
+        self.fh = fh
+        self.data = data
+
+    def next_chunk(self):
+        self.fh.write(self.data)
+        return None, True
+
+
+class _FakeService:
+    """Drive service whose files() resource is backed by a _FakeDrive"""
+
+    def __init__(self, drive):
+        self.drive = drive
+
+    def files(self):
+        return _FakeFiles(self.drive)
+
+
+def _index(photo_counter):
+    """Build a minimal index with the given photo counter"""
+    return {"sessions": {"Default": []}, "photo_counter": photo_counter, "version": "1.0"}
+
+
+def _patched(drive):
+    """Patch the storage module to talk to the fake drive"""
+    service = _FakeService(drive)
+    return (
+        patch.object(GoogleDriveStorage, "_build_service", lambda self: service),
+        patch.object(storage, "_get_configured_root_folder_id", lambda: ROOT_FOLDER_ID),
+        patch.object(storage, "MediaIoBaseDownload", _FakeDownload),
+    )
+
+
+def _clear_session_state():
+    """Remove every key from session state"""
+    for key in list(st.session_state.keys()):
+        del st.session_state[key]
+
+
+def test_queued_index_reaches_drive():
+    """Test that a queued index is the one left in Drive once flushed"""
+    drive = _FakeDrive(upload_delay=0.05)
+    build, root, download = _patched(drive)
+    with build, root, download:
+        backend = GoogleDriveStorage(object())
+        backend.save_index_async(_index(1))
+        backend.save_index_async(_index(2))
+        backend.flush_index_writes()
+        
+        assert backend.index_writer is None
+        reloaded = GoogleDriveStorage(object())
+        assert reloaded.load_index()["photo_counter"] == 2
+    print("✓ Queued index reaches Drive test passed")
+
+
+def test_backend_swap_sees_queued_index():
+    """Test that a new backend loads the index the old one still had queued"""
+    _clear_session_state()
+    drive = _FakeDrive()
+    build, root, download = _patched(drive)
+    with build, root, download:
+        old_backend = GoogleDriveStorage(object())
+        old_backend.save_index(_index(1))
+        st.session_state["drive_storage"] = old_backend
+        
+        # Slow the upload down so it is still queued when the backend changes
+        drive.upload_delay = 0.3
+        old_backend.save_index_async(_index(2))
+        
+        new_backend = App._get_drive_storage(None, object())
+        assert new_backend is not old_backend
+        assert st.session_state["drive_storage"] is new_backend
+        assert new_backend.load_index()["photo_counter"] == 2
+    _clear_session_state()
+    print("✓ Backend swap sees queued index test passed")
+
+
+def test_flush_without_writer():
+    """Test that flushing a backend that never queued an upload is a no-op"""
+    backend = GoogleDriveStorage(object())
+    backend.flush_index_writes()
+    
+    assert backend.index_writer is None
+    print("✓ Flush without writer test passed")
+
+
+def run_all_tests():
+    """Run all tests"""
+    tests = [
+        test_queued_index_reaches_drive,
+        test_backend_swap_sees_queued_index,
+        test_flush_without_writer,
+    ]
+    
+    print("\n" + "="*60)
+    print("Running Index Writer Tests")
+    print("="*60 + "\n")
+    
+    passed = 0
+    failed = 0
+    
+    for test in tests:
+        try:
+            test()
+            passed += 1
+        except Exception as e:
+            print(f"✗ {test.__name__} FAILED: {e}")
+            import traceback
+            traceback.print_exc()
+            failed += 1
+    
+    print("\n" + "="*60)
+    print(f"Test Results: {passed} passed, {failed} failed")
+    print("="*60 + "\n")
+    
+    return failed == 0
+
+
+if __name__ == "__main__":
+    success = run_all_tests()
+    sys.exit(0 if success else 1)
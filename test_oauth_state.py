@@ -0,0 +1,155 @@
+"""
+Tests for the signed OAuth state tokens used for CSRF protection.
+Runs against oauth_utils directly with an in-memory OAuth config.
+"""
+
+import sys
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).parent))
+
+import base64
+import time
+from unittest.mock import patch
+
+import oauth_utils
+from oauth_utils import create_state_token, verify_state_token
+
+
+TEST_OAUTH_CONFIG = {
+    "client_id": "test-client-id",
+    "client_secret": "test-client-secret",
+    "redirect_uri": "http://localhost:8501/oauth2callback",
+    "cookie_secret": "test-cookie-secret",
+}
+
+
+def _use_config(config):
+    """Install an OAuth config in the module cache"""
+    oauth_utils._oauth_config = config
+    oauth_utils._get_state_hmac.cache_clear()
+
+
+def _decode(token):
+    """Decode a state token to its raw bytes"""
+    return base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+
+
+def _encode(raw):
+    """Encode raw bytes the way create_state_token does"""
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode("ascii")
+
+
+def setup_function():
+    _use_config(dict(TEST_OAUTH_CONFIG))
+
+
+def teardown_function():
+    _use_config(None)
+
+
+def test_valid_token_round_trip():
+    """Test that a freshly created token verifies"""
+    token = create_state_token()
+    
+    assert verify_state_token(token)
+    assert create_state_token() != token, "Each token should have its own nonce"
+    print("✓ Valid token round-trip test passed")
+
+
+def test_tampered_signature():
+    """Test that a token with a modified signature is rejected"""
+    raw = bytearray(_decode(create_state_token()))
+    raw[-1] ^= 0x01
+    
+    assert not verify_state_token(_encode(bytes(raw)))
+    print("✓ Tampered signature test passed")
+
+
+def test_other_secret_rejected():
+    """Test that a token signed with another cookie_secret is rejected"""
+    token = create_state_token()
+    _use_config(dict(TEST_OAUTH_CONFIG, cookie_secret="another-secret"))
+    
+    assert not verify_state_token(token)
+    print("✓ Other secret test passed")
+
+
+def test_wrong_length():
+    """Test that tokens of the wrong decoded length are rejected"""
+    raw = _decode(create_state_token())
+    
+    assert not verify_state_token(_encode(raw[:-1]))
+    assert not verify_state_token(_encode(raw + b"\x00"))
+    print("✓ Wrong length test passed")
+
+
+def test_non_base64_input():
+    """Test that input that isn't URL-safe base64 is rejected"""
+    assert not verify_state_token("not a state token!")
+    assert not verify_state_token("état-non-ascii")
+    print("✓ Non-base64 input test passed")
+
+
+def test_expired_token():
+    """Test that a token older than the maximum age is rejected"""
+    issued = time.time()
+    with patch("oauth_utils.time.time", return_value=issued):
+        token = create_state_token()
+    
+    max_age = oauth_utils._STATE_MAX_AGE_SECONDS
+    with patch("oauth_utils.time.time", return_value=issued + max_age - 1):
+        assert verify_state_token(token)
+    with patch("oauth_utils.time.time", return_value=issued + max_age + 1):
+        assert not verify_state_token(token)
+    print("✓ Expired token test passed")
+
+
+def test_empty_state():
+    """Test that a missing or empty state is rejected"""
+    assert not verify_state_token("")
+    assert not verify_state_token(None)
+    print("✓ Empty state test passed")
+
+
+def run_all_tests():
+    """Run all tests"""
+    tests = [
+        test_valid_token_round_trip,
+        test_tampered_signature,
+        test_other_secret_rejected,
+        test_wrong_length,
+        test_non_base64_input,
+        test_expired_token,
+        test_empty_state,
+    ]
+    
+    print("\n" + "="*60)
+    print("Running OAuth State Token Tests")
+    print("="*60 + "\n")
+    
+    passed = 0
+    failed = 0
+    
+    for test in tests:
+        setup_function()
+        try:
+            test()
+            passed += 1
+        except Exception as e:
+            print(f"✗ {test.__name__} FAILED: {e}")
+            import traceback
+            traceback.print_exc()
+            failed += 1
+        finally:
+            teardown_function()
+    
+    print("\n" + "="*60)
+    print(f"Test Results: {passed} passed, {failed} failed")
+    print("="*60 + "\n")
+    
+    return failed == 0
+
+
+if __name__ == "__main__":
+    success = run_all_tests()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,160 @@
+"""
+Tests for SessionStore's per-session photo ID index.
+Runs SessionStore against Streamlit's session state in bare mode.
+"""
+
+import sys
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).parent))
+
+import streamlit as st
+from PIL import Image
+
+from app import SessionStore
+
+
+def _new_store():
+    """Create a SessionStore over empty session state, without storage"""
+    for key in list(st.session_state.keys()):
+        del st.session_state[key]
+    return SessionStore()
+
+
+def _add(store, session_name):
+    """Add a small photo to a session and return its ID"""
+    return store.add_photo(Image.new('RGB', (20, 20), color='white'), session_name)
+
+
+def test_lookup_by_id():
+    """Test that photos are found in their own session only"""
+    store = _new_store()
+    store.create_session('Other')
+    first = _add(store, 'Default')
+    second = _add(store, 'Default')
+    
+    assert store.get_photo(first, 'Default')['id'] == first
+    assert store.get_photo(second, 'Default')['id'] == second
+    assert store.get_photo(first, 'Other') is None
+    assert store.get_photo(first, 'Missing') is None
+    print("✓ Lookup by ID test passed")
+
+
+def test_add_move_delete_update_index():
+    """Test that add, move and delete keep lookups current"""
+    store = _new_store()
+    store.create_session('Other')
+    first = _add(store, 'Default')
+    assert store.get_photo(first, 'Default') is not None
+    
+    assert store.move_photo(first, 'Default', 'Other')
+    assert store.get_photo(first, 'Default') is None
+    assert store.get_photo(first, 'Other')['id'] == first
+    
+    # Delete then add keeps the list length, so only invalidation catches it
+    second = _add(store, 'Other')
+    assert store.get_photo(second, 'Other') is not None
+    assert store.delete_photo(first, 'Other')
+    third = _add(store, 'Other')
+    assert store.get_photo(first, 'Other') is None
+    assert store.get_photo(third, 'Other')['id'] == third
+    print("✓ Add/move/delete index test passed")
+
+
+def test_rebuild_on_list_replacement():
+    """Test that replacing a session's list (as drag-and-drop does) rebuilds the index"""
+    store = _new_store()
+    store.create_session('Other')
+    first = _add(store, 'Default')
+    second = _add(store, 'Default')
+    assert store.get_photo(first, 'Default') is not None
+    
+    # Same length, new list object: move the first photo out, second stays
+    photo = store.sessions['Default'][0]
+    st.session_state.sessions['Default'] = [store.sessions['Default'][1], {**photo, 'id': 99}]
+    st.session_state.sessions['Other'] = [photo]
+    
+    assert store.get_photo(first, 'Default') is None
+    assert store.get_photo(99, 'Default')['id'] == 99
+    assert store.get_photo(second, 'Default')['id'] == second
+    assert store.get_photo(first, 'Other')['id'] == first
+    print("✓ Rebuild on list replacement test passed")
+
+
+def test_rebuild_on_length_change():
+    """Test that changing a session's list in place rebuilds the index"""
+    store = _new_store()
+    first = _add(store, 'Default')
+    assert store.get_photo(first, 'Default') is not None
+    
+    store.sessions['Default'].pop()
+    assert store.get_photo(first, 'Default') is None
+    print("✓ Rebuild on length change test passed")
+
+
+class _CountingStorage:
+    """Storage stand-in that counts index loads"""
+    
+    def __init__(self, loads):
+        self.loads = loads
+    
+    def load_index(self):
+        self.loads.append(self)
+        return {'sessions': {}, 'photo_counter': 0, 'version': '1.0'}
+
+
+def test_drive_index_loads_once_per_user():
+    """Test that the Drive index loads once per signed-in user, not per backend"""
+    _new_store()
+    loads = []
+    storage = _CountingStorage(loads)
+    
+    SessionStore(storage_backend=storage, user_email='a@example.com')
+    SessionStore(storage_backend=storage, user_email='a@example.com')
+    assert len(loads) == 1
+    
+    # A rebuilt backend for the same user keeps the photos already loaded
+    SessionStore(storage_backend=_CountingStorage(loads), user_email='a@example.com')
+    assert len(loads) == 1
+    
+    SessionStore(storage_backend=storage, user_email='b@example.com')
+    assert len(loads) == 2
+    print("✓ Drive index loads once per user test passed")
+
+
+def run_all_tests():
+    """Run all tests"""
+    tests = [
+        test_lookup_by_id,
+        test_add_move_delete_update_index,
+        test_rebuild_on_list_replacement,
+        test_rebuild_on_length_change,
+        test_drive_index_loads_once_per_user,
+    ]
+    
+    print("\n" + "="*60)
+    print("Running Photo Index Tests")
+    print("="*60 + "\n")
+    
+    passed = 0
+    failed = 0
+    
+    for test in tests:
+        try:
+            test()
+            passed += 1
+        except Exception as e:
+            print(f"✗ {test.__name__} FAILED: {e}")
+            import traceback
+            traceback.print_exc()
+            failed += 1
+    
+    print("\n" + "="*60)
+    print(f"Test Results: {passed} passed, {failed} failed")
+    print("="*60 + "\n")
+    
+    return failed == 0
+
+
+if __name__ == "__main__":
+    success = run_all_tests()
+    sys.exit(0 if success else 1)